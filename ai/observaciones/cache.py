@@ -0,0 +1,102 @@
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CACHE_DB = Path(
+    "data/obs_cache.sqlite"
+)  # tablas cache(key, fixed), cache_norm(key, fixed), estado(clave, valor)
+
+
+def _key(texto: str, version: str) -> str:
+    # version identifica modelo/prompt/config: si cambian, las entradas viejas no aplican
+    return hashlib.blake2b(f"{version}\x00{texto}".encode(), digest_size=16).hexdigest()
+
+
+def normalizar(texto: str) -> str:
+    # Variantes que sólo difieren en mayúsculas o espacios llevan la misma corrección
+    return " ".join(texto.split()).casefold()
+
+
+def abrir(path: Path = CACHE_DB) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    # WAL: cada checkpoint por batch es un commit barato
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, fixed TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache_norm (key TEXT PRIMARY KEY, fixed TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS estado (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)"
+    )
+    return conn
+
+
+def buscar(
+    conn: sqlite3.Connection, textos: Iterable[str], version: str
+) -> Dict[str, str]:
+    """
+    Devuelve {texto: corrección} para los textos que ya están en la cache.
+    Primero busca el texto exacto y, para los que falten, su forma normalizada.
+    """
+    textos = {t for t in textos if t is not None}
+    por_key = {_key(t, version): t for t in textos}
+    hits = {por_key[k]: fixed for k, fixed in _select(conn, "cache", por_key)}
+    faltan = textos - hits.keys()
+    if faltan:
+        por_norm: Dict[str, list] = {}
+        for t in faltan:
+            por_norm.setdefault(_key(normalizar(t), version), []).append(t)
+        for k, fixed in _select(conn, "cache_norm", por_norm):
+            for t in por_norm[k]:
+                hits[t] = fixed
+    return hits
+
+
+def _select(
+    conn: sqlite3.Connection, tabla: str, keys: Iterable[str]
+) -> List[Tuple[str, str]]:
+    """Devuelve los pares (key, fixed) de la tabla para las keys pedidas."""
+    out: List[Tuple[str, str]] = []
+    keys = list(keys)
+    # sqlite limita la cantidad de parámetros por sentencia
+    for i in range(0, len(keys), 500):
+        chunk = keys[i : i + 500]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, fixed FROM {tabla} WHERE key IN ({marks})", chunk
+        )
+        out.extend(rows)
+    return out
+
+
+def guardar(
+    conn: sqlite3.Connection, pares: Iterable[Tuple[str, str]], version: str
+) -> None:
+    """Guarda pares (texto original, corrección), por texto exacto y normalizado."""
+    pares = [(texto, fixed) for texto, fixed in pares if texto is not None]
+    conn.executemany(
+        "INSERT OR REPLACE INTO cache (key, fixed) VALUES (?, ?)",
+        [(_key(texto, version), fixed) for texto, fixed in pares],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO cache_norm (key, fixed) VALUES (?, ?)",
+        [(_key(normalizar(texto), version), fixed) for texto, fixed in pares],
+    )
+    conn.commit()
+
+
+def leer_estado(conn: sqlite3.Connection, clave: str) -> Optional[str]:
+    row = conn.execute("SELECT valor FROM estado WHERE clave = ?", (clave,)).fetchone()
+    return row[0] if row else None
+
+
+def guardar_estado(conn: sqlite3.Connection, clave: str, valor: str) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO estado (clave, valor) VALUES (?, ?)", (clave, valor)
+    )
+    conn.commit()
@@ -0,0 +1,68 @@
+from pathlib import Path
+import polars as pl
+
+INPUT_CSV = Path("data/observaciones.csv")  # columnas: id, observaciones
+OUTPUT_CSV = Path(
+    "data/observaciones_final.csv"
+)  # columnas: id, observaciones_original, observaciones_final
+# Estado de trabajo: se relee en cada corrida. El CSV se sigue exportando porque
+# es lo que consume el repo del ETL, pero se regenera desde acá: editarlo a mano
+# no sirve, la próxima corrida lo pisa.
+OUTPUT_PARQUET = Path("data/observaciones_final.parquet")
+
+INPUT_SCHEMA = {"id": pl.Int64, "observaciones": pl.Utf8}
+OUTPUT_SCHEMA = {
+    "id": pl.Int64,
+    "observaciones_original": pl.Utf8,
+    "observaciones_final": pl.Utf8,
+}
+
+
+def leer_input() -> pl.LazyFrame:
+    if not INPUT_CSV.exists():
+        raise FileNotFoundError(f"No existe {INPUT_CSV}")
+    # Los tipos se fijan al parsear, sin inferencia ni casts posteriores
+    lf = pl.scan_csv(INPUT_CSV, schema_overrides=INPUT_SCHEMA)
+    if not set(INPUT_SCHEMA).issubset(lf.collect_schema().names()):
+        raise ValueError("Se espera CSV con columnas: id, observaciones")
+    return lf.select(*INPUT_SCHEMA).unique(subset="id", keep="last")
+
+
+def leer_output() -> pl.LazyFrame:
+    if not OUTPUT_PARQUET.exists() and OUTPUT_CSV.exists():
+        _migrar_csv()
+    if OUTPUT_PARQUET.exists():
+        # Parquet guarda el esquema: no hace falta fijar tipos ni validar columnas
+        return (
+            pl.scan_parquet(OUTPUT_PARQUET)
+            .select(*OUTPUT_SCHEMA)
+            .unique(subset="id", keep="last")
+        )
+    return pl.LazyFrame(schema=OUTPUT_SCHEMA)
+
+
+def _migrar_csv() -> None:
+    """Migración única: antes de OUTPUT_PARQUET el estado vivía sólo en OUTPUT_CSV."""
+    lf = pl.scan_csv(OUTPUT_CSV, schema_overrides=OUTPUT_SCHEMA)
+    expected = set(OUTPUT_SCHEMA)
+    if not expected.issubset(lf.collect_schema().names()):
+        raise ValueError(f"{OUTPUT_CSV} debe tener columnas {expected}")
+    lf = lf.select(*OUTPUT_SCHEMA).unique(subset="id", keep="last").sort("id")
+    lf.sink_parquet(OUTPUT_PARQUET, compression="zstd", compression_level=3)
+    print(f"📦 {OUTPUT_CSV} migrado a {OUTPUT_PARQUET}")
+
+
+def escribir_output(lf: pl.LazyFrame) -> None:
+    """Escribe el Parquet de estado y el CSV para el ETL en un solo recorrido del plan."""
+    OUTPUT_PARQUET.parent.mkdir(parents=True, exist_ok=True)
+    # El Parquet se escribe aparte y se reemplaza al final: el anterior puede
+    # seguir mapeado en memoria por el scan de esta misma corrida.
+    tmp = OUTPUT_PARQUET.with_suffix(".parquet.tmp")
+    pl.collect_all(
+        [
+            lf.sink_parquet(tmp, compression="zstd", compression_level=3, lazy=True),
+            lf.sink_csv(OUTPUT_CSV, lazy=True),
+        ],
+        engine="streaming",
+    )
+    tmp.replace(OUTPUT_PARQUET)
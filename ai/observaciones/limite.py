@@ -0,0 +1,35 @@
+import asyncio
+import time
+from collections import deque
+
+VENTANA_SECONDS = 60
+
+
+class Limitador:
+    """
+    Limita requests y tokens por minuto con una ventana deslizante de 60 s.
+    Cada request espera en esperar() hasta que entra en la cuota, en vez de
+    dispararse y volver con un 429.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._envios: deque = deque()  # (instante, tokens)
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    async def esperar(self, tokens: int) -> None:
+        # Un request más grande que toda la cuota igual tiene que poder salir
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                while self._envios and ahora - self._envios[0][0] >= VENTANA_SECONDS:
+                    self._tokens -= self._envios.popleft()[1]
+                if len(self._envios) < self.rpm and self._tokens + tokens <= self.tpm:
+                    self._envios.append((ahora, tokens))
+                    self._tokens += tokens
+                    return
+                # esperar a que salga de la ventana el envío más viejo
+                await asyncio.sleep(VENTANA_SECONDS - (ahora - self._envios[0][0]))
@@ -1,22 +1,26 @@
-from pathlib import Path
 import sys
 
+import polars as pl
+
+from ai.observaciones.datos import INPUT_CSV, leer_input
 from ai.observaciones.preparar_observaciones import preparar
 from ai.observaciones.procesar_observaciones import procesar
 
 
-INPUT_CSV = Path("data/observaciones.csv")
-
-
 def main():
     if not INPUT_CSV.exists():
         raise FileNotFoundError(
             f"No se puede continuar: falta {INPUT_CSV}. Este archivo es obligatorio."
         )
+    # El CSV de entrada se parsea una sola vez y se comparte entre ambos pasos
+    df_in = leer_input().collect(engine="streaming")
     # 1) sincronizar estado (vigentes, antiguas, cambios de texto)
-    preparar()
+    df_out = preparar(df_in)
+    if df_out.filter(pl.col("observaciones_final").is_null()).is_empty():
+        print("✅ observaciones: no hay pendientes. Nada que hacer.")
+        return
     # 2) procesar únicamente las pendientes
-    procesar()
+    procesar(df_in, df_out)
 
 
 if __name__ == "__main__":
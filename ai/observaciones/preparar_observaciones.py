@@ -1,103 +1,70 @@
-from pathlib import Path
-import polars as pl
-
-INPUT_CSV = Path("data/observaciones.csv")  # columnas: id, observaciones
-OUTPUT_CSV = Path(
-    "data/observaciones_final.csv"
-)  # columnas: id, observaciones_original, observaciones_final
-
-
-def _read_input() -> pl.DataFrame:
-    if not INPUT_CSV.exists():
-        raise FileNotFoundError(f"No existe {INPUT_CSV}")
-    df = pl.read_csv(INPUT_CSV)
-    if not {"id", "observaciones"}.issubset(df.columns):
-        raise ValueError("Se espera CSV con columnas: id, observaciones")
-    return df.select(
-        pl.col("id").cast(pl.Int64),
-        pl.col("observaciones").cast(pl.Utf8),
-    ).unique(subset="id", keep="last")
+from typing import Optional
 
+import polars as pl
 
-def _read_or_empty_output() -> pl.DataFrame:
-    if OUTPUT_CSV.exists():
-        df = pl.read_csv(OUTPUT_CSV)
-        expected = {"id", "observaciones_original", "observaciones_final"}
-        if not expected.issubset(df.columns):
-            raise ValueError(f"{OUTPUT_CSV} debe tener columnas {expected}")
-        return df.select(
-            pl.col("id").cast(pl.Int64),
-            pl.col("observaciones_original").cast(pl.Utf8),
-            pl.col("observaciones_final").cast(pl.Utf8),
-        ).unique(subset="id", keep="last")
-    return pl.DataFrame(
-        schema={
-            "id": pl.Int64,
-            "observaciones_original": pl.Utf8,
-            "observaciones_final": pl.Utf8,
-        }
-    )
+from ai.observaciones.datos import (
+    OUTPUT_CSV,
+    escribir_output,
+    leer_input,
+    leer_output,
+)
 
 
-def preparar() -> pl.DataFrame:
+def preparar(df_in: Optional[pl.DataFrame] = None) -> pl.DataFrame:
     """
     Sincroniza observaciones_final con observaciones, y deja pendientes las que deban re-procesarse.
     Reglas:
       - ids que no estén en observaciones.csv => se eliminan de observaciones_final.
       - ids nuevos => se agregan con observaciones_original y observaciones_final = null.
       - si cambió el texto de observaciones => se actualiza observaciones_original y se vacía observaciones_final (requiere reproceso).
+    Si se pasa df_in (observaciones ya leídas) no se vuelve a parsear el CSV de entrada.
     Devuelve el DF final ya listo (pendientes = filas con observaciones_final nula).
     """
-    df_in = _read_input()
-    df_out = _read_or_empty_output()
-
-    # 1) eliminar antiguos (ids no vigentes)
-    df_out = df_out.join(df_in.select("id"), on="id", how="inner")
+    lf_in = df_in.lazy() if df_in is not None else leer_input()
+    lf_out = leer_output()
 
+    # 1) eliminar antiguos (ids no vigentes) y traer el texto vigente en un solo join
     # 2) actualizar originales y vaciar finales si cambió el texto
-    df_out = (
-        df_out.join(
-            df_in, on="id", how="left"
-        )  # agrega columna "observaciones" (vigente)
+    cambio = pl.col("observaciones").is_not_null() & (
+        pl.col("observaciones") != pl.col("observaciones_original")
+    )
+    lf_out = (
+        lf_out.join(lf_in, on="id", how="inner")  # agrega "observaciones" (vigente)
+        .with_columns(cambio.alias("_cambio"))
         .with_columns(
-            pl.when(
-                pl.col("observaciones").is_not_null()
-                & (pl.col("observaciones") != pl.col("observaciones_original"))
-            )
+            pl.when(pl.col("_cambio"))
             .then(pl.col("observaciones"))
             .otherwise(pl.col("observaciones_original"))
             .alias("observaciones_original"),
-            pl.when(
-                pl.col("observaciones").is_not_null()
-                & (pl.col("observaciones") != pl.col("observaciones_original"))
-            )
+            pl.when(pl.col("_cambio"))
             .then(pl.lit(None, dtype=pl.Utf8))  # invalidar final si cambió el original
             .otherwise(pl.col("observaciones_final"))
             .alias("observaciones_final"),
         )
-        .drop("observaciones")
+        .drop("observaciones", "_cambio")
     )
 
     # 3) agregar ids nuevos (final nulo para que queden pendientes)
-    faltantes = df_in.join(df_out.select("id"), on="id", how="anti")
+    faltantes = lf_in.join(lf_out.select("id"), on="id", how="anti")
     nuevos = faltantes.select(
         pl.col("id"),
         pl.col("observaciones").alias("observaciones_original"),
         pl.lit(None, dtype=pl.Utf8).alias("observaciones_final"),
     )
 
-    final_df = (
-        pl.concat([df_out, nuevos], how="vertical")
-        .unique(subset="id", keep="last")
-        .sort("id")
+    # lf_out y nuevos ya traen ids únicos y disjuntos (anti-join), así que no hace
+    # falta deduplicar después del concat
+    final_lf = pl.concat([lf_out, nuevos], how="vertical").sort("id")
+    # collect_all comparte los subplanes comunes (lecturas y joins) entre ambos
+    final_df, n_nuevos = pl.collect_all(
+        [final_lf, nuevos.select(pl.len())], engine="streaming"
     )
 
-    OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-    final_df.write_csv(OUTPUT_CSV, include_header=True)
+    escribir_output(final_df.lazy())
 
     print(
         f"🧭 preparar_observaciones: {final_df.height} filas vigentes en {OUTPUT_CSV} "
-        f"(nuevas={nuevos.height}, revalidadas={(final_df['observaciones_final'].is_null()).sum()})"
+        f"(nuevas={n_nuevos.item()}, revalidadas={(final_df['observaciones_final'].is_null()).sum()})"
     )
     return final_df
 
@@ -1,209 +1,474 @@
-import os, time, json
-from pathlib import Path
-from typing import Dict, List
+import asyncio
+import hashlib
+import itertools
+import os, json, time
+import random
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import httpx
 import polars as pl
 from pydantic import BaseModel
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types as genai_types
 from dotenv import load_dotenv
 
+from ai.observaciones import cache
+from ai.observaciones.datos import escribir_output, leer_input, leer_output
+from ai.observaciones.limite import Limitador
+
 load_dotenv()
 
 MODEL_NAME = "gemini-2.5-flash"
 MAX_ATTEMPTS = 3
-RETRY_SECONDS = 10
-BATCH_SIZE = 100
+REQUEST_TIMEOUT_MS = 180_000  # por request a Gemini (ms, como HttpOptions)
+RETRY_MAX_SECONDS = 60  # tope de la espera antes de reintentar un batch (429 incluido)
+BATCH_SIZE = 100  # tamaño inicial; se ajusta según cómo responde el modelo
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 500
+TARGET_LATENCY_SECONDS = 45
+MAX_BATCH_CHARS = 25_000  # tope de texto por request, además del tope de items
+# Cuota del proyecto en Gemini; el limitador frena antes de llegar al 429
+RPM_LIMIT = int(os.getenv("GEMINI_RPM", "1000"))
+TPM_LIMIT = int(os.getenv("GEMINI_TPM", "1000000"))
+# Requests en vuelo contra Gemini; nunca más que los que entran en un minuto
+CONCURRENCY = min(int(os.getenv("GEMINI_CONCURRENCY", "8")), RPM_LIMIT)
+
 
-INPUT_CSV = Path("data/observaciones.csv")  # columnas: id, observaciones
-OUTPUT_CSV = Path(
-    "data/observaciones_final.csv"
-)  # columnas: id, observaciones_original, observaciones_final
+@dataclass(slots=True)
+class Correction:
+    id: int
+    observaciones_final: str
 
 
-class Correction(BaseModel):
+class _CorrectionSchema(BaseModel):
+    # Sólo describe la respuesta esperada a Gemini; el parseo usa Correction
     id: int
     observaciones_final: str
 
 
-ResponseSchema = list[Correction]
-
-
-def _read_input() -> pl.DataFrame:
-    if not INPUT_CSV.exists():
-        raise FileNotFoundError(f"No existe {INPUT_CSV}")
-    df = pl.read_csv(INPUT_CSV)
-    if not {"id", "observaciones"}.issubset(df.columns):
-        raise ValueError("Se espera CSV con columnas: id, observaciones")
-    return df.select(
-        pl.col("id").cast(pl.Int64),
-        pl.col("observaciones").cast(pl.Utf8),
-    ).unique(subset="id", keep="last")
-
-
-def _read_or_empty_output() -> pl.DataFrame:
-    if OUTPUT_CSV.exists():
-        df = pl.read_csv(OUTPUT_CSV)
-        expected = {"id", "observaciones_original", "observaciones_final"}
-        if not expected.issubset(df.columns):
-            raise ValueError(f"{OUTPUT_CSV} debe tener columnas {expected}")
-        return df.select(
-            pl.col("id").cast(pl.Int64),
-            pl.col("observaciones_original").cast(pl.Utf8),
-            pl.col("observaciones_final").cast(pl.Utf8),
-        ).unique(subset="id", keep="last")
-    return pl.DataFrame(
-        schema={
-            "id": pl.Int64,
-            "observaciones_original": pl.Utf8,
-            "observaciones_final": pl.Utf8,
-        }
-    )
+ResponseSchema = list[_CorrectionSchema]
+Item = Tuple[int, str, str]  # (id, observaciones, {id, observaciones} como JSON)
+
+
+# Prompt y config son constantes: se arman una vez y se reutilizan en cada batch
+PROMPT = (
+    "Tarea: Corregí ortografía, mayúsculas/minúsculas, espacios y signos de puntuación "
+    "de cada observación SIN perder información ni resumir. No agregues contenido ni cambies el significado. "
+    "Devolvé SOLO JSON válido con [{id:int, observaciones_final:string}]."
+)
+GENERATE_CONFIG = genai_types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=ResponseSchema,
+    temperature=0,  # determinístico: la misma entrada puede resolverse desde cache
+)
+# Versión de la cache: cambia sola si se modifica el modelo, el prompt o la config
+CACHE_VERSION = hashlib.sha256(
+    f"{MODEL_NAME}\n{PROMPT}\n{GENERATE_CONFIG.temperature}\n"
+    f"{json.dumps(_CorrectionSchema.model_json_schema(), sort_keys=True)}".encode()
+).hexdigest()[:16]
+
 
+_JSON = json.JSONDecoder()
 
-def _prompt() -> str:
-    return (
-        "Tarea: Corregí ortografía, mayúsculas/minúsculas, espacios y signos de puntuación "
-        "de cada observación SIN perder información ni resumir. No agregues contenido ni cambies el significado. "
-        "Devolvé SOLO JSON válido con [{id:int, observaciones_final:string}]."
+
+def _drain_json_array(buf: str) -> tuple[list, str]:
+    """Extrae los objetos completos de un array JSON parcial y devuelve el resto."""
+    items = []
+    pos = 0
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n[,":
+            pos += 1
+        if pos >= len(buf) or buf[pos] == "]":
+            break
+        try:
+            obj, pos_fin = _JSON.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            break
+        items.append(obj)
+        pos = pos_fin
+    return items, buf[pos:]
+
+
+def _payload(batch: List[Item]) -> str:
+    """Lista JSON de {id, observaciones}: cada fila ya viene serializada desde Polars."""
+    return "[" + ",".join(item[2] for item in batch) + "]"
+
+
+def _es_rate_limit(exc: BaseException) -> bool:
+    return isinstance(exc, genai_errors.APIError) and (
+        exc.code == 429 or exc.status == "RESOURCE_EXHAUSTED"
     )
 
 
-def _call_batch(client: genai.Client, batch: List[dict]) -> List[Correction]:
-    contents = [
-        _prompt(),
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Segundos sugeridos por la API (header Retry-After o RetryInfo), si los hay."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        for d in details.get("error", {}).get("details", []):
+            delay = str(d.get("retryDelay", ""))
+            if delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    return None
+
+
+def _espera_reintento(exc: BaseException, attempt: int) -> float:
+    """Backoff antes de reintentar un batch que falló, con tope RETRY_MAX_SECONDS.
+
+    En un 429 se respeta la demora que pide la API; si no la hay (u otro error),
+    exponencial con jitter.
+    """
+    demora = _retry_after(exc) if _es_rate_limit(exc) else None
+    if demora is None:
+        demora = 2**attempt + random.random()
+    return min(demora, RETRY_MAX_SECONDS)
+
+
+# Sin reintentos propios: todos (429, errores y respuestas incompletas) pasan por
+# la cola de _corregir, así MAX_ATTEMPTS es el tope total de requests por item.
+def _contenidos(batch: List[Item]) -> List[str]:
+    return [
+        PROMPT,
         "Entradas (lista de {id, observaciones}):",
-        json.dumps(batch, ensure_ascii=False),
+        _payload(batch),
         "Salida: lista JSON de {id, observaciones_final}.",
     ]
-    cfg = genai_types.GenerateContentConfig(
-        response_mime_type="application/json",
-        response_schema=ResponseSchema,
-        temperature=0.2,
+
+
+async def _call_batch(client: genai.Client, contents: List[str]) -> List[Correction]:
+    stream = await client.aio.models.generate_content_stream(
+        model=MODEL_NAME, contents=contents, config=GENERATE_CONFIG
     )
-    resp = client.models.generate_content(
-        model=MODEL_NAME, contents=contents, config=cfg
+    # Parseamos las correcciones a medida que llegan: si la respuesta se corta,
+    # conservamos las completas y sólo se re-encolan las faltantes.
+    out: List[Correction] = []
+    buf = ""
+    try:
+        async for chunk in stream:
+            buf += chunk.text or ""
+            items, buf = _drain_json_array(buf)
+            for it in items:
+                if not isinstance(it, dict):
+                    continue
+                id_, fixed = it.get("id"), it.get("observaciones_final")
+                if isinstance(id_, str) and id_.isdigit():
+                    id_ = int(id_)
+                if type(id_) is int and isinstance(fixed, str):
+                    out.append(Correction(id_, fixed))
+    except Exception:
+        if not out:
+            raise
+    return out
+
+
+def _client() -> genai.Client:
+    # Con un transporte httpx propio el SDK reutiliza un pool keep-alive (HTTP/2)
+    # entre batches; sin él abre una sesión aiohttp nueva por cada request.
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=CONCURRENCY * 2,
+            max_keepalive_connections=CONCURRENCY,
+            keepalive_expiry=60,
+        ),
     )
+    return genai.Client(
+        api_key=os.environ["GEMINI_API_KEY"],
+        # El transporte propio no trae timeout y, sin HttpOptions.timeout, el SDK
+        # le pasa timeout=None a httpx: un stream trabado colgaría su worker.
+        # Son milisegundos; httpx lo aplica a cada fase (conexión y cada lectura)
+        # y el SDK además lo manda como X-Server-Timeout, un plazo del servidor
+        # para toda la generación: tiene que alcanzar para el batch más grande.
+        http_options=genai_types.HttpOptions(
+            timeout=REQUEST_TIMEOUT_MS, async_client_args={"transport": transport}
+        ),
+    )
+
+
+def _armar_batches(items: List[Item], max_items: int) -> List[List[Item]]:
+    """
+    Agrupa por largo de texto (first-fit decreasing): cada batch suma a lo sumo
+    MAX_BATCH_CHARS caracteres y max_items observaciones. Una observación más
+    larga que el tope va sola.
+    """
+    batches: List[List[Item]] = []
+    chars: List[int] = []
+    for item in sorted(items, key=lambda it: len(it[1] or ""), reverse=True):
+        n = len(item[1] or "")
+        for b, usado in enumerate(chars):
+            if usado + n <= MAX_BATCH_CHARS and len(batches[b]) < max_items:
+                batches[b].append(item)
+                chars[b] += n
+                break
+        else:
+            batches.append([item])
+            chars.append(n)
+    return batches
+
+
+def _ajustar_batch_size(
+    size: int, enviado: int, lleno: bool, ratio: float, latencia: float
+) -> int:
+    """
+    Achica el batch ante respuestas incompletas; lo agranda si sobra margen.
+    enviado es el batch más grande que respondió y lleno indica si alguno llegó
+    al tope (de items o de caracteres): un batch chico que sale completo no dice
+    nada sobre si el tamaño configurado aguanta más.
+    """
+    if ratio < 0.9:
+        return min(size, max(MIN_BATCH_SIZE, enviado // 2))
+    if lleno and ratio == 1.0 and latencia < TARGET_LATENCY_SECONDS:
+        return min(MAX_BATCH_SIZE, int(size * 1.25))
+    return size
+
+
+async def _corregir(
+    client: genai.Client, conn: sqlite3.Connection, records: List[Item]
+) -> Dict[int, str]:
+    results: Dict[int, str] = {}
+    batch_size = int(cache.leer_estado(conn, "batch_size") or BATCH_SIZE)
+    limitador = Limitador(RPM_LIMIT, TPM_LIMIT)
+
+    # Abrir la conexión (TCP+TLS) antes de disparar los batches en paralelo
     try:
-        parsed = resp.parsed
-        if isinstance(parsed, list):
-            return parsed
+        await client.aio.models.get(model=MODEL_NAME)
     except Exception:
         pass
-    txt = (resp.text or "").strip()
-    if not txt:
-        return []
+
+    # Cola ordenada por instante de salida: un batch que falla se re-encola con su
+    # propio backoff y el resto sigue saliendo, sin una pausa global entre rondas.
+    cola: asyncio.PriorityQueue = asyncio.PriorityQueue()
+    orden = itertools.count()  # desempate: los batches (listas) no se comparan
+    # Por intento: [items en batches que respondieron, items corregidos,
+    # latencia máx, batches abiertos, batch más grande que respondió, si alguno
+    # respondió lleno]. Los batches que fallaron no cuentan: una caída o una API
+    # key inválida no dicen nada sobre el tamaño del batch.
+    intentos: Dict[int, list] = {}
+
+    def _encolar(items: List[Item], attempt: int, listo_en: float) -> None:
+        # Lleno: no le entraba ni la observación más corta (por items o caracteres)
+        minimo = min(len(it[1] or "") for it in items)
+        for batch in _armar_batches(items, batch_size):
+            chars = sum(len(it[1] or "") for it in batch)
+            lleno = len(batch) >= batch_size or chars + minimo > MAX_BATCH_CHARS
+            intentos.setdefault(attempt, [0, 0, 0.0, 0, 0, False])[3] += 1
+            cola.put_nowait((listo_en, next(orden), attempt, batch, lleno))
+
+    def _registrar(
+        batch: List[Item], corr: object, attempt: int, lleno: bool, latencia: float
+    ) -> List[Item]:
+        """Guarda lo corregido del batch y devuelve los items que faltaron."""
+        nonlocal batch_size
+        respondio = not isinstance(corr, BaseException)
+        if not respondio:
+            corr = []
+        ids = {item[0] for item in batch}
+        got = set()
+        for c in corr:
+            if c.id in ids and isinstance(c.observaciones_final, str):
+                results[c.id] = c.observaciones_final
+                got.add(c.id)
+        nuevos, faltan = [], []
+        for item in batch:
+            if item[0] in got:
+                nuevos.append((item[1], results[item[0]]))
+            else:
+                faltan.append(item)
+        # Checkpoint por batch: si la corrida se corta, lo ya corregido queda
+        # en la cache y la próxima corrida lo toma de ahí.
+        cache.guardar(conn, nuevos, CACHE_VERSION)
+
+        stats = intentos[attempt]
+        if respondio:
+            stats[0] += len(batch)
+            stats[1] += len(got)
+            stats[2] = max(stats[2], latencia)
+            stats[4] = max(stats[4], len(batch))
+            stats[5] = stats[5] or lleno
+        stats[3] -= 1
+        if stats[3] == 0 and stats[0]:
+            # Terminaron los batches de este intento: el tamaño ajustado rige
+            # para los reintentos y para la próxima corrida
+            batch_size = _ajustar_batch_size(
+                batch_size, stats[4], stats[5], stats[1] / stats[0], stats[2]
+            )
+            cache.guardar_estado(conn, "batch_size", str(batch_size))
+        return faltan
+
+    async def _worker() -> None:
+        while True:
+            listo_en, _, attempt, batch, lleno = await cola.get()
+            try:
+                espera = listo_en - time.monotonic()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                contents = _contenidos(batch)
+                # ~4 caracteres por token; la salida ocupa más o menos lo mismo
+                # que la entrada. La espera del limitador queda fuera de la
+                # latencia: el ajuste del batch mide sólo lo que tarda Gemini.
+                await limitador.esperar(2 * sum(len(c) for c in contents) // 4)
+                t0 = time.monotonic()
+                try:
+                    corr = await _call_batch(client, contents)
+                except Exception as e:
+                    corr = e
+                faltan = _registrar(batch, corr, attempt, lleno, time.monotonic() - t0)
+                if faltan and attempt < MAX_ATTEMPTS:
+                    # Una respuesta incompleta se reintenta enseguida; un error espera
+                    backoff = 0.0
+                    if isinstance(corr, BaseException):
+                        backoff = _espera_reintento(corr, attempt)
+                    _encolar(faltan, attempt + 1, time.monotonic() + backoff)
+            finally:
+                cola.task_done()
+
+    _encolar(records, 1, time.monotonic())
+    # CONCURRENCY workers: a lo sumo esa cantidad de requests en vuelo
+    workers = [asyncio.create_task(_worker()) for _ in range(CONCURRENCY)]
+    fin = asyncio.create_task(cola.join())
     try:
-        data = json.loads(txt)
-        out = []
-        if isinstance(data, list):
-            for it in data:
-                if isinstance(it, dict) and "id" in it and "observaciones_final" in it:
-                    out.append(Correction(**it))
-        return out
-    except Exception:
-        return []
+        # Un worker sólo termina si falla fuera de _call_batch (p. ej. sqlite en el
+        # checkpoint); en ese caso la cola no se vacía nunca y join() no volvería.
+        await asyncio.wait([fin, *workers], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in (fin, *workers):
+            t.cancel()
+        await asyncio.gather(fin, *workers, return_exceptions=True)
+    for w in workers:
+        if not w.cancelled() and w.exception() is not None:
+            raise w.exception()
 
+    return results
 
-def procesar() -> pl.DataFrame:
-    if not os.getenv("GEMINI_API_KEY"):
-        raise RuntimeError("Falta GEMINI_API_KEY")
 
-    df_in = _read_input()
-    df_out = _read_or_empty_output()
+def procesar(
+    df_in: Optional[pl.DataFrame] = None, df_out: Optional[pl.DataFrame] = None
+) -> None:
+    """
+    Corrige con Gemini las observaciones pendientes (observaciones_final nula) y
+    escribe el resultado con escribir_output().
+    df_in / df_out permiten reutilizar lo ya leído por preparar() sin re-parsear los CSV.
+    """
+    if df_in is None:
+        df_in = leer_input().collect(engine="streaming")
+    if df_out is None:
+        df_out = leer_output().collect(engine="streaming")
 
-    # Determinar pendientes:
-    # - si no existe output => procesar TODO
-    # - si existe => procesar ids con observaciones_final nula (y que sigan vigentes en observaciones.csv)
+    # Si no existe output, partimos de todas las observaciones sin corregir; así
+    # un mismo camino sirve para la corrida inicial y para las incrementales.
     if df_out.is_empty():
-        df_todo = df_in
-    else:
-        pendientes_ids = df_out.filter(pl.col("observaciones_final").is_null()).select(
-            "id"
+        df_out = df_in.select(
+            "id",
+            pl.col("observaciones").alias("observaciones_original"),
+            pl.lit(None, dtype=pl.Utf8).alias("observaciones_final"),
         )
-        df_todo = df_in.join(pendientes_ids, on="id", how="inner")
+
+    # Pendientes: ids con observaciones_final nula (y que sigan vigentes en observaciones.csv)
+    pendientes_ids = df_out.filter(pl.col("observaciones_final").is_null()).select("id")
+    df_todo = df_in.join(pendientes_ids, on="id", how="inner")
 
     if df_todo.height == 0:
         print("✅ procesar_observaciones: no hay pendientes. Nada que hacer.")
         # reordenar/reescribir por las dudas
-        df_out.sort("id").write_csv(OUTPUT_CSV, include_header=True)
-        return df_out.sort("id")
-
-    client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+        escribir_output(df_out.lazy().sort("id"))
+        return
 
-    records = df_todo.to_dicts()
-    pending = records[:]
-    results: Dict[int, str] = {}
-    attempt = 1
+    # Las correcciones se acumulan como frames (id, observaciones_final) y se
+    # unen al output con un único join al final.
+    chunks: List[pl.DataFrame] = []
 
-    while pending and attempt <= MAX_ATTEMPTS:
-        new_pending = []
-        for i in range(0, len(pending), BATCH_SIZE):
-            batch = pending[i : i + BATCH_SIZE]
-            ids = {x["id"] for x in batch}
-            try:
-                corr = _call_batch(client, batch)
-            except Exception:
-                corr = []
-            got = set()
-            for c in corr:
-                if c.id in ids and isinstance(c.observaciones_final, str):
-                    results[c.id] = c.observaciones_final
-                    got.add(c.id)
-            for item in batch:
-                if item["id"] not in got:
-                    new_pending.append(item)
-        if new_pending and attempt < MAX_ATTEMPTS:
-            time.sleep(RETRY_SECONDS)
-        pending = new_pending
-        attempt += 1
-
-    if not results:
-        raise RuntimeError("No se generaron correcciones.")
+    # Observaciones ya corregidas en corridas anteriores no vuelven a Gemini
+    conn = cache.abrir()
+    hits = cache.buscar(conn, df_todo["observaciones"].to_list(), CACHE_VERSION)
+    df_hits = df_todo.join(
+        pl.DataFrame(
+            list(hits.items()),
+            schema={"observaciones": pl.Utf8, "observaciones_final": pl.Utf8},
+            orient="row",
+        ),
+        on="observaciones",
+        how="inner",
+    ).select("id", "observaciones_final")
+    chunks.append(df_hits)
 
-    df_results = pl.DataFrame(
-        {"id": list(results.keys()), "observaciones_final": list(results.values())}
-    ).with_columns(pl.col("id").cast(pl.Int64))
+    # Un solo pedido por texto distinto, sin distinguir mayúsculas ni espacios
+    # (la misma clave que la cache normalizada); la corrección se replica a todas
+    # las variantes
+    df_faltan = df_todo.join(df_hits.select("id"), on="id", how="anti").with_columns(
+        pl.col("observaciones")
+        .map_elements(cache.normalizar, return_dtype=pl.Utf8)
+        .alias("_clave")
+    )
+    df_unique = df_faltan.unique(subset="_clave", keep="first", maintain_order=True)
+    # El JSON de cada fila se arma del lado de Polars (Rust), no en Python
+    records = list(
+        df_unique.select(
+            "id",
+            "observaciones",
+            pl.struct("id", "observaciones").struct.json_encode().alias("json"),
+        ).iter_rows()
+    )
 
-    if df_out.is_empty():
-        # Creamos desde cero
-        final_df = (
-            df_in.join(df_results, on="id", how="left")
-            .select(
-                "id",
-                pl.col("observaciones").alias("observaciones_original"),
-                "observaciones_final",
+    try:
+        if records:
+            if not os.getenv("GEMINI_API_KEY"):
+                raise RuntimeError("Falta GEMINI_API_KEY")
+            client = _client()
+            corregidas = asyncio.run(_corregir(client, conn, records))
+            df_map = df_unique.select(
+                "_clave",
+                pl.Series(
+                    "observaciones_final",
+                    [corregidas.get(item[0]) for item in records],
+                    dtype=pl.Utf8,
+                ),
             )
-            .sort("id")
-        )
-    else:
-        # Actualizamos observaciones_final para los ids procesados, y sincronizamos original a lo vigente
-        final_df = (
-            df_out.join(df_results, on="id", how="left", suffix="_new")
-            .join(df_in, on="id", how="left")  # trae observaciones vigentes
-            .with_columns(
-                # si hay nuevo resultado, usarlo; sino mantener el actual
-                pl.coalesce(
-                    [pl.col("observaciones_final_new"), pl.col("observaciones_final")]
-                ).alias("observaciones_final"),
-                # asegurar que el original coincida con lo vigente
-                pl.when(pl.col("observaciones").is_not_null())
-                .then(pl.col("observaciones"))
-                .otherwise(pl.col("observaciones_original"))
-                .alias("observaciones_original"),
+            chunks.append(
+                df_faltan.join(df_map, on="_clave", how="inner", nulls_equal=True)
+                .drop_nulls("observaciones_final")
+                .select("id", "observaciones_final")
             )
-            .select("id", "observaciones_original", "observaciones_final")
-            .unique(subset="id", keep="last")
-            .sort("id")
+    finally:
+        conn.close()
+    print(
+        f"🗃️ procesar_observaciones: {df_hits.height} observaciones resueltas desde cache"
+    )
+
+    df_results = pl.concat(chunks, rechunk=True)
+    if df_results.is_empty():
+        raise RuntimeError("No se generaron correcciones.")
+
+    # Actualizamos observaciones_final para los ids procesados, y sincronizamos original
+    # a lo vigente (update sólo pisa con valores no nulos). El plan se escribe
+    # directo a disco sin materializar el frame final.
+    final_lf = (
+        df_out.lazy()
+        .update(df_results.lazy(), on="id", how="left")
+        .update(
+            df_in.lazy().select(
+                "id", pl.col("observaciones").alias("observaciones_original")
+            ),
+            on="id",
+            how="left",
         )
+        .sort("id")
+    )
 
-    OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-    final_df.write_csv(OUTPUT_CSV, include_header=True)
+    escribir_output(final_lf)
+    # update(how="left") conserva exactamente las filas de df_out
     print(
-        f"✅ procesar_observaciones: +{df_results.height} filas procesadas. Total={final_df.height}"
+        f"✅ procesar_observaciones: +{df_results.height} filas procesadas. Total={df_out.height}"
     )
 
-    return final_df
-
 
 if __name__ == "__main__":
     procesar()
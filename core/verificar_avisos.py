@@ -4,7 +4,8 @@ from urllib.parse import urljoin
 from html import unescape
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
 import polars as pl
 
 requests.packages.urllib3.disable_warnings()
@@ -16,59 +17,80 @@ BASE = "https://educacion.sanjuan.edu.ar"
 OUT_PATH = Path("data/avisos.csv")
 
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/125.0 Safari/537.36",
+    "Accept-Language": "es-AR,es;q=0.9,en;q=0.8",
+}
+
+# Sesión compartida: reutiliza la conexión TCP+TLS entre requests (keep-alive)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.verify = False
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+
 def fetch_html(url: str) -> str:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/125.0 Safari/537.36",
-        "Accept-Language": "es-AR,es;q=0.9,en;q=0.8",
-    }
-    resp = requests.get(url, headers=headers, timeout=30, verify=False)
+    resp = _SESSION.get(url, timeout=30)
     resp.raise_for_status()
-    # La página viene en UTF-8; BeautifulSoup manejará bien los acentos.
+    # La página viene en UTF-8; lxml manejará bien los acentos.
     return resp.text
 
 
+def _clase(nombre: str) -> str:
+    # Equivalente XPath de ".nombre" en CSS (lxml no trae cssselect)
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {nombre} ')"
+
+
+def _texto(el: lxml_html.HtmlElement) -> str:
+    # Igual que get_text(strip=True) de BeautifulSoup: cada nodo de texto
+    # recortado y concatenado sin separador.
+    return "".join(t.strip() for t in el.itertext())
+
+
 def parse_avisos(html: str) -> list[dict]:
-    soup = BeautifulSoup(html, "lxml")
+    # lxml directo: el árbol de BeautifulSoup era la mayor parte del tiempo
+    root = lxml_html.fromstring(
+        html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8")
+    )
 
     # Tabla principal con class="Normal"
-    table = soup.select_one("table.Normal")
-    if not table:
+    tables = root.xpath(f"//table[{_clase('Normal')}]")
+    if not tables:
         raise RuntimeError("No se encontró la tabla con class 'Normal'.")
+    table = tables[0]
 
-    tbody = table.find("tbody") or table
+    tbody = table.find("tbody")
+    if tbody is None:
+        tbody = table
 
     avisos: list[dict] = []
 
-    for tr in tbody.find_all("tr"):
-        classes = tr.get("class", [])
-        if isinstance(classes, str):
-            classes = [classes]
-
+    for tr in tbody.iter("tr"):
         # Saltar filas de subtítulo
-        if "SubHead" in classes:
+        if "SubHead" in (tr.get("class") or "").split():
             continue
 
         # Enlace del título: preferimos el <td class="TÍTULOCell">, con fallback a
         # cualquier <a> cuya etiqueta no sea 'DESCARGAR'.
         a_tag = None
-        titulo_cell = tr.find("td", class_="TÍTULOCell")
-        if titulo_cell:
-            a_tag = titulo_cell.find("a", href=True)
+        links = tr.xpath(f"(.//td[{_clase('TÍTULOCell')}])[1]//a[@href]")
+        if links:
+            a_tag = links[0]
 
-        if not a_tag:
-            for cand in tr.find_all("a", href=True):
-                if cand.get_text(strip=True).upper() != "DESCARGAR":
+        if a_tag is None:
+            for cand in tr.xpath(".//a[@href]"):
+                if _texto(cand).upper() != "DESCARGAR":
                     a_tag = cand
                     break
 
-        if not a_tag:
+        if a_tag is None:
             # Nada útil en esta fila
             continue
 
-        titulo = " ".join(a_tag.get_text(strip=True).split())
-        href = unescape(a_tag["href"])
+        titulo = " ".join(_texto(a_tag).split())
+        href = unescape(a_tag.get("href"))
         url_abs = urljoin(BASE, href)
 
         avisos.append({"nombre": titulo, "url": url_abs})
@@ -80,9 +102,8 @@ def parse_avisos(html: str) -> list[dict]:
 
 
 def save_as_csv(rows: list[dict], out_path: Path) -> None:
-    df = pl.DataFrame(rows)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    df.write_csv(out_path)
+    pl.LazyFrame(rows).sink_csv(out_path)
 
 
 def main():
@@ -1,17 +1,20 @@
 import asyncio
+import codecs
+import html
 import json
+import re
 import time
 import warnings
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
 
-import aiohttp
+import httpx
+import orjson
 import polars as pl
-import requests
 from bs4 import BeautifulSoup
 import json5
 
-requests.packages.urllib3.disable_warnings()
 warnings.filterwarnings("ignore")
 
 DAYS = 7
@@ -26,19 +29,56 @@ HEADERS = {
         "Chrome/138.0.0.0 Safari/537.36"
     ),
     "X-Requested-With": "XMLHttpRequest",
-    "Referer": URL,
+    # httpx sólo acepta headers ASCII: la "á" del path va percent-encoded
+    "Referer": str(httpx.URL(URL)),
 }
 
 OUT_PATH = Path("ofrecimientos.parquet")
 
+_TA_RE = re.compile(rb"<textarea\b[^>]*>(.*?)</textarea\s*>", re.S | re.I)
+
+# Último __VIEWSTATE válido (más las cookies de la sesión que lo emitió)
+VIEWSTATE_CACHE = Path("data/_viewstate.json")
+# Bastante más que el cron de */15: el archivo restaurado siempre tiene ~15 min
+# más la demora del scheduler. Si igual venció, _fetch_date lo detecta y se
+# vuelve a pedir la página.
+VIEWSTATE_TTL_SECONDS = 2 * 60 * 60
+
 
 def _get_hidden(soup: BeautifulSoup, name: str) -> str:
     tag = soup.find("input", {"name": name})
     return tag["value"] if tag and tag.has_attr("value") else ""
 
 
-def _bootstrap_viewstate() -> tuple[str, str]:
-    resp = requests.get(URL, timeout=30, verify=False)
+def _leer_viewstate(client: httpx.AsyncClient) -> Optional[tuple[str, str]]:
+    """Devuelve el viewstate cacheado si sigue vigente, cargando sus cookies."""
+    try:
+        data = orjson.loads(VIEWSTATE_CACHE.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    # La marca de tiempo va en el archivo: actions/cache no garantiza el mtime
+    if time.time() - data.get("guardado", 0) > VIEWSTATE_TTL_SECONDS:
+        return None
+    for nombre, valor in data["cookies"].items():
+        client.cookies.set(nombre, valor)
+    return data["viewstate"], data["viewstate_gen"]
+
+
+def _guardar_viewstate(
+    client: httpx.AsyncClient, viewstate: str, viewstate_gen: str
+) -> None:
+    data = {
+        "viewstate": viewstate,
+        "viewstate_gen": viewstate_gen,
+        "cookies": {c.name: c.value for c in client.cookies.jar},
+        "guardado": time.time(),
+    }
+    VIEWSTATE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    VIEWSTATE_CACHE.write_bytes(orjson.dumps(data))
+
+
+async def _bootstrap_viewstate(client: httpx.AsyncClient) -> tuple[str, str]:
+    resp = await client.get(URL)
     resp.raise_for_status()
     soup = BeautifulSoup(resp.text, "html.parser")
     viewstate = _get_hidden(soup, "__VIEWSTATE")
@@ -47,8 +87,12 @@ def _bootstrap_viewstate() -> tuple[str, str]:
 
 
 async def _fetch_date(
-    session: aiohttp.ClientSession, fecha_iso: str, viewstate: str, viewstate_gen: str
-) -> list[dict]:
+    client: httpx.AsyncClient, fecha_iso: str, viewstate: str, viewstate_gen: str
+) -> Optional[list[dict]]:
+    """
+    Filas de una fecha, o None si la respuesta no sirve (error HTTP, sin textarea o
+    sobre de Ext.NET con success=false), típicamente por un viewstate vencido.
+    """
     cfg = {
         "config": {
             "extraParams": {
@@ -69,34 +113,89 @@ async def _fetch_date(
         "__ExtNetDirectEventMarker": "delta=true",
     }
     params = {"_dc": str(int(time.time() * 1000))}
-    async with session.post(
-        URL, params=params, data=payload, headers=HEADERS, timeout=30, ssl=False
-    ) as resp:
-        text = await resp.text()
-
-    soup = BeautifulSoup(text, "html.parser")
-    ta = soup.find("textarea")
-    if not ta:
-        return []
-    parsed = json5.loads(ta.get_text(strip=True))
-    return parsed.get("serviceResponse", {}).get("data", {}).get("data", [])
-
-
-async def _gather_all(viewstate: str, viewstate_gen: str) -> list[dict]:
+    resp = await client.post(URL, params=params, data=payload, headers=HEADERS)
+    if not resp.is_success:
+        return None
+    body = resp.content
+    encoding = resp.encoding
+
+    # La respuesta es siempre el mismo sobre de ExtJS (un <textarea> con JSON):
+    # alcanza con una regex sobre los bytes, sin armar un árbol HTML.
+    m = _TA_RE.search(body)
+    if not m:
+        return None
+    txt = m.group(1)
+    # Sólo hace falta decodificar si hay entidades HTML o el charset no es UTF-8
+    if b"&" in txt or codecs.lookup(encoding).name != "utf-8":
+        txt = html.unescape(txt.decode(encoding))
+    # Casi siempre es JSON estricto; json5 (Python puro, mucho más lento) queda de respaldo
+    try:
+        parsed = orjson.loads(txt)
+    except orjson.JSONDecodeError:
+        parsed = json5.loads(txt if isinstance(txt, str) else txt.decode(encoding))
+    servicio = parsed.get("serviceResponse", {})
+    if parsed.get("success") is False or servicio.get("success") is False:
+        return None
+    return servicio.get("data", {}).get("data", [])
+
+
+async def _fetch_all(
+    client: httpx.AsyncClient,
+    fechas: list[str],
+    viewstate: str,
+    viewstate_gen: str,
+) -> list[Optional[pl.DataFrame]]:
+    """Un DataFrame por fecha, en el orden de `fechas` (None si esa fecha falló)."""
+
+    async def _una(i: int, fecha: str) -> tuple[int, Optional[list[dict]]]:
+        return i, await _fetch_date(client, fecha, viewstate, viewstate_gen)
+
+    frames: list[Optional[pl.DataFrame]] = [None] * len(fechas)
+    # Cada día pasa a columnar apenas llega, sin esperar al más lento
+    for coro in asyncio.as_completed([_una(i, f) for i, f in enumerate(fechas)]):
+        i, rows = await coro
+        if rows is not None:
+            frames[i] = pl.DataFrame(rows, infer_schema_length=None)
+    return frames
+
+
+def _unir(frames: list[Optional[pl.DataFrame]]) -> pl.DataFrame:
+    # Orden por fecha fijo: el hash del parquet no puede depender de la red
+    frames = [f for f in frames if f is not None and f.height]
+    return pl.concat(frames, how="diagonal_relaxed") if frames else pl.DataFrame()
+
+
+async def _gather_all() -> pl.DataFrame:
     fechas = [
         (datetime.now() + timedelta(days=i)).strftime("%Y-%m-%dT00:00:00")
         for i in range(DAYS)
     ]
-    async with aiohttp.ClientSession() as session:
-        tasks = [_fetch_date(session, f, viewstate, viewstate_gen) for f in fechas]
-        results = await asyncio.gather(*tasks)
-    return [row for sub in results for row in sub]
+    # Un solo cliente HTTP/2 para el bootstrap y los POST: todas las fechas
+    # viajan multiplexadas sobre la misma conexión TLS
+    async with httpx.AsyncClient(
+        http2=True, verify=False, timeout=30, limits=httpx.Limits(max_connections=16)
+    ) as client:
+        cacheado = _leer_viewstate(client)
+        if cacheado:
+            try:
+                frames = await _fetch_all(client, fechas, *cacheado)
+                if all(f is not None for f in frames):
+                    return _unir(frames)
+            except ValueError:  # JSON inválido: también lo tomamos como vencido
+                pass
+            print("♻️ Viewstate cacheado rechazado; se vuelve a pedir la página.")
+            VIEWSTATE_CACHE.unlink(missing_ok=True)
+            client.cookies.clear()
+
+        viewstate, viewstate_gen = await _bootstrap_viewstate(client)
+        frames = await _fetch_all(client, fechas, viewstate, viewstate_gen)
+        if all(f is not None for f in frames):
+            _guardar_viewstate(client, viewstate, viewstate_gen)
+    return _unir(frames)
 
 
 def main() -> None:
-    viewstate, viewstate_gen = _bootstrap_viewstate()
-    rows = asyncio.run(_gather_all(viewstate, viewstate_gen))
-    df = pl.DataFrame(rows) if rows else pl.DataFrame()
+    df = asyncio.run(_gather_all())
 
     print(f"➡️ Ofrecimientos obtenidos: {df.height}")
     if df.height: